@@ -1,6 +1,14 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
 import logging
-import sys
+import os
+import re
+import tarfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
 import guestfs
 
@@ -9,46 +17,139 @@ logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:%(message
 
 BASES_DIR = Path(__file__).resolve().parent / "bases"
 
-# Actions de base communes
+# Archive des bases (propriétaire root:root), extraite en un seul appel tar_in
+BASES_TAR = BASES_DIR.parent / "bases.tar"
+
+# Dimensionnement de l'appliance libguestfs (Mo / nombre de vCPU max)
+APPLIANCE_MEMSIZE = 768
+APPLIANCE_MAX_SMP = 4
+
+# Appliance réduite pour les migrations parallèles, afin que plusieurs workers tiennent sur l'hôte
+WORKER_MEMSIZE = 512
+WORKER_SMP = 2
+
+# Cache d'appliance partagé (tmpfs) entre les workers, sauf si LIBGUESTFS_CACHEDIR est déjà défini
+WORKER_CACHEDIR = "/dev/shm"
+
+# Label du disque migré, nécessaire pour le retirer à chaud entre deux images
+DRIVE_LABEL = "migration"
+
+# Points de montage des disques secondaires ignorés en mode single disk
+SKIP_WORDS = ('backup', 'data', 'storage')
+SKIP_RE = re.compile('|'.join(SKIP_WORDS), re.IGNORECASE)
+
+# Device de base d'une partition (ex: /dev/sda1 -> /dev/sda)
+DEV_BASE_RE = re.compile(r'(/dev/[A-Za-z]+)')
+
+# Augeas : ni chargement initial ni autoload des modules, seule la transformation Fstab
+# sur /etc/fstab est déclarée à la main dans /augeas/load avant aug_load()
+AUG_NO_LOAD = 32
+AUG_NO_MODL_AUTOLOAD = 64
+FSTAB_VDA_SPECS = "/files/etc/fstab/*/spec[. =~ regexp('/dev/vda.*')]"
+FSTAB_SKIP_ENTRIES = (
+    "/files/etc/fstab/*[spec =~ regexp('/dev/.*')]"
+    f"[file =~ regexp('.*({'|'.join(SKIP_WORDS)}).*', 'i')]"
+)
+
+# Fichiers GRUB corrigés (vda -> sda)
+GRUB_FILES = ("/etc/default/grub", "/boot/grub2/grub.cfg", "/boot/grub/grub.cfg")
+
+# Correction vda -> sda des fichiers GRUB existants, en un seul appel ; affiche les fichiers modifiés
+GRUB_FIX_SCRIPT = (
+    f"for f in {' '.join(GRUB_FILES)}; do"
+    " if [ -f \"$f\" ] && grep -q /dev/vda \"$f\"; then"
+    " sed -i 's|/dev/vda|/dev/sda|g' \"$f\" && echo \"$f\";"
+    " fi;"
+    " done"
+)
+
+# Systèmes de fichiers candidats pour la racine quand l'inspection est court-circuitée
+ROOT_FSTYPES = ("ext4", "xfs")
+
+# Points de montage secondaires lus dans le fstab de l'invité, un "point device" par ligne
+# (UUID=/LABEL= résolus par findfs, /dev/vdX renommés en /dev/sdX comme le fait l'inspection)
+FSTAB_MOUNTS_SCRIPT = r"""awk '$1 ~ /^(\/dev\/|UUID=|LABEL=)/ && $2 ~ /^\// && $2 != "/" { print $1, $2 }' /etc/fstab |
+while read -r spec mountpoint; do
+    case "$spec" in
+        /dev/*) device=$(echo "$spec" | sed 's|^/dev/vd|/dev/sd|') ;;
+        *) device=$(findfs "$spec" 2>/dev/null) || continue ;;
+    esac
+    echo "$mountpoint $device"
+done"""
+
+# Contextes SELinux utilisés pour le relabel
+SELINUX_FILE_CONTEXTS = "/etc/selinux/targeted/contexts/files/file_contexts"
+
+# Chemins dont l'existence est sondée une seule fois après le montage
+PROBE_PATHS = ("/boot/efi/EFI",) + GRUB_FILES
+
+# Partition EFI : montée pendant BASE_ACTIONS (grubby lit /etc/grub2-efi.cfg et grubenv
+# sur l'ESP), puis démontée avant le relabel SELinux
+EFI_MOUNTPOINT = "/boot/efi"
+
+# Script de finalisation exécuté en un seul appel g.sh() (un seul aller-retour RPC)
+FINALIZE_SCRIPT = r"""set -e
+echo "timeout 5;" > /etc/dhcp/dhclient.conf
+rm -f /etc/ld.so.cache
+: > /etc/machine-id
+grubby --args=console=ttyS0,115200n8 --update-kernel $(grubby --default-kernel)
+systemctl set-default multi-user.target
+sed -ri '/^net.ipv4.conf.all.arp_ignore\s*=/{s/.*/net.ipv4.conf.all.arp_ignore = 1/}' /etc/sysctl.conf
+"""
+
+# Permissions des fichiers copiés depuis les bases, regroupées par mode
+BASE_MODES = {
+    "0700": ("/root", "/root/.ssh"),
+    "0644": (
+        "/etc/sysconfig/qemu-ga.scaleway",
+        "/etc/systemd/system/qemu-guest-agent.service.d/50-scaleway.conf",
+        "/etc/NetworkManager/conf.d/00-scaleway.conf",
+    ),
+    "0664": ("/root/.ssh/instance_keys",),
+    "0755": (
+        "/etc",
+        "/etc/sysconfig",
+        "/etc/systemd",
+        "/etc/systemd/system",
+        "/etc/systemd/system/qemu-guest-agent.service.d",
+        "/etc/NetworkManager",
+        "/etc/NetworkManager/conf.d",
+    ),
+}
+
+# Un chmod multi-chemins par mode, le tout en un seul appel g.sh()
+CHMOD_SCRIPT = " && ".join(f"chmod {mode} {' '.join(paths)}" for mode, paths in BASE_MODES.items())
+
+# Actions de base communes, regroupées pour limiter les appels à l'appliance
 BASE_ACTIONS = [
-    ["copy_in", str(BASES_DIR), "/run"],
-    ["sh", "chown -R 0:0 /run/bases"],
-    ["cp_a", "/run/bases/root", "/"],
-    ["cp_a", "/run/bases/etc", "/"],
-    ["chmod", 448, "/root"],
-    ["chmod", 448, "/root/.ssh"],
-    ["chmod", 420, "/etc/sysconfig/qemu-ga.scaleway"],
-    ["chmod", 420, "/etc/systemd/system/qemu-guest-agent.service.d/50-scaleway.conf"],
-    ["chmod", 420, "/etc/NetworkManager/conf.d/00-scaleway.conf"],
-    ["chmod", 436, "/root/.ssh/instance_keys"],
-    ["chmod", 493, "/etc"],
-    ["chmod", 493, "/etc/sysconfig"],
-    ["chmod", 493, "/etc/systemd"],
-    ["chmod", 493, "/etc/systemd/system"],
-    ["chmod", 493, "/etc/systemd/system/qemu-guest-agent.service.d"],
-    ["chmod", 493, "/etc/NetworkManager"],
-    ["chmod", 493, "/etc/NetworkManager/conf.d"],
-    ["sh", 'echo "timeout 5;" > /etc/dhcp/dhclient.conf'],
-    ["sh", "rm -Rf /run/bases"],
-    ["sh", "rm -f /etc/ld.so.cache"],
-    ["sh", ": > /etc/machine-id"],
-    ["sh", "grubby --args=console=ttyS0,115200n8 --update-kernel $(grubby --default-kernel)"],
-    ["sh", "systemctl set-default multi-user.target"],
-    ["sh", r"sed -ri '/^net.ipv4.conf.all.arp_ignore\s*=/{s/.*/net.ipv4.conf.all.arp_ignore = 1/}' /etc/sysctl.conf"],
+    ["tar_in", str(BASES_TAR), "/"],
+    ["sh", CHMOD_SCRIPT],
+    ["sh", FINALIZE_SCRIPT],
 ]
 
 
-def detect_boot_mode(g: guestfs.GuestFS) -> str:
+@dataclass
+class GuestCache:
+    """Métadonnées de l'invité, valides tant qu'aucune action ne modifie le disque"""
+    devices: frozenset
+    exists: dict[str, bool] = field(default_factory=dict)
+
+    def probe(self, g: guestfs.GuestFS, paths: tuple[str, ...]) -> None:
+        """Sonde l'existence de tous les chemins en un seul appel g.sh()"""
+        script = f'for p in {" ".join(paths)}; do if [ -e "$p" ]; then echo "$p"; fi; done'
+        found = set(g.sh(script).split())
+        self.exists.update((path, path in found) for path in paths)
+
+
+def detect_boot_mode(cache: GuestCache) -> str:
     """Détecte le mode de boot (UEFI ou Legacy)"""
-    # Vérifier si /boot/efi existe et est monté
-    if g.exists("/boot/efi") and g.is_dir("/boot/efi"):
-        # Vérifier si EFI directory existe
-        if g.exists("/boot/efi/EFI"):
-            logger.info("Mode de boot détecté : UEFI")
-            return "uefi"
+    # Vérifier si le répertoire EFI existe sous /boot/efi (ESP montée)
+    if cache.exists["/boot/efi/EFI"]:
+        logger.info("Mode de boot détecté : UEFI")
+        return "uefi"
 
     # Vérifier la présence de grub legacy
-    if g.exists("/boot/grub2/grub.cfg") or g.exists("/boot/grub/grub.cfg"):
+    if cache.exists["/boot/grub2/grub.cfg"] or cache.exists["/boot/grub/grub.cfg"]:
         logger.info("Mode de boot détecté : Legacy BIOS")
         return "legacy"
 
@@ -56,34 +157,89 @@ def detect_boot_mode(g: guestfs.GuestFS) -> str:
     return "legacy"
 
 
-def guest_mount(g: guestfs.GuestFS, single_disk_mode: bool = True) -> None:
-    """Monte les systèmes de fichiers, avec option pour gérer un seul disque."""
+def _root_owned(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
+    """Force le propriétaire root:root des entrées de l'archive"""
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = "root"
+    return tarinfo
+
+
+def ensure_bases_tar() -> Path:
+    """Construit l'archive des bases si elle est absente ou plus ancienne que le répertoire"""
+    newest = max(path.stat().st_mtime for path in [BASES_DIR, *BASES_DIR.rglob("*")])
+    if BASES_TAR.exists() and BASES_TAR.stat().st_mtime >= newest:
+        return BASES_TAR
+
+    logger.info(f"Construction de {BASES_TAR}")
+    # Écriture dans un fichier temporaire propre au processus puis remplacement atomique
+    tmp_tar = BASES_TAR.with_suffix(f".tar.{os.getpid()}")
+    with tarfile.open(tmp_tar, "w") as tar:
+        for top in ("root", "etc"):
+            tar.add(BASES_DIR / top, arcname=top, filter=_root_owned)
+    os.replace(tmp_tar, BASES_TAR)
+    return BASES_TAR
+
+
+def inspect_mountpoints(g: guestfs.GuestFS) -> dict[str, str]:
+    """Détermine les points de montage via l'inspection libguestfs"""
     roots = g.inspect_os()
     if len(roots) != 1:
         raise RuntimeError(f"Impossible de gérer plusieurs racines : {roots}")
-    root = roots[0]
+    return g.inspect_get_mountpoints(roots[0])
+
+
+def probe_mountpoints(g: guestfs.GuestFS) -> dict[str, str]:
+    """Détermine les points de montage sans inspection : racine ext4/xfs puis fstab de l'invité"""
+    for device, fstype in g.list_filesystems().items():
+        if fstype not in ROOT_FSTYPES:
+            continue
+
+        try:
+            g.mount_ro(device, "/")
+        except RuntimeError:
+            continue
+
+        try:
+            if not g.exists("/etc/os-release"):
+                continue
+
+            logger.info(f"Racine détectée sans inspection : {device}")
+            mountpoints = {"/": device}
+            for line in g.sh(FSTAB_MOUNTS_SCRIPT).splitlines():
+                mountpoint, _, fs_device = line.partition(" ")
+                if fs_device:
+                    mountpoints[mountpoint] = fs_device
+            return mountpoints
+        finally:
+            g.umount_all()
+
+    raise RuntimeError("Aucune racine contenant /etc/os-release trouvée")
+
 
-    # Obtenir la liste des devices disponibles
-    available_devices = set(g.list_devices())
+def guest_mount(g: guestfs.GuestFS, mountpoints: dict[str, str], cache: GuestCache,
+                single_disk_mode: bool = True) -> None:
+    """Monte les systèmes de fichiers, avec option pour gérer un seul disque."""
+    # Liste des devices disponibles (en cache)
+    available_devices = cache.devices
     logger.info(f"Devices disponibles : {available_devices}")
 
     # Track mounted filesystems
     mounted = []
 
-    for mountpoint, device in sorted(g.inspect_get_mountpoints(root).items()):
+    # Trier par profondeur pour monter les parents avant les enfants (/ puis /boot puis /boot/efi)
+    ordered = sorted(mountpoints.items(), key=lambda kv: (kv[0].rstrip('/').count('/'), kv[0]))
+
+    for mountpoint, device in ordered:
         # En mode single_disk, on ignore les points de montage des disques non disponibles
         if single_disk_mode:
             # Extraire le device de base (ex: /dev/sda1 -> /dev/sda)
-            device_parts = device.split('/')
-            if len(device_parts) >= 3:
-                device_base = '/' + '/'.join(device_parts[1:3])
-                device_base = device_base.rstrip('0123456789')
+            m = DEV_BASE_RE.match(device)
+            device_base = m.group(1) if m else device
 
-                # Vérifier si c'est un disque secondaire non disponible
-                if device_base not in available_devices and any(skip_word in mountpoint.lower()
-                    for skip_word in ['backup', 'data', 'storage']):
-                    logger.warning(f"Skipping mount of {device} on {mountpoint} - disk not available")
-                    continue
+            # Vérifier si c'est un disque secondaire non disponible
+            if device_base not in available_devices and SKIP_RE.search(mountpoint):
+                logger.warning(f"Skipping mount of {device} on {mountpoint} - disk not available")
+                continue
 
         try:
             g.mount(device, mountpoint)
@@ -96,137 +252,236 @@ def guest_mount(g: guestfs.GuestFS, single_disk_mode: bool = True) -> None:
     return mounted
 
 
-def fix_fstab_for_scaleway(g: guestfs.GuestFS, single_disk_mode: bool = True) -> None:
-    """Corrige les entrées fstab pour Scaleway"""
+def fix_fstab_with_augeas(g: guestfs.GuestFS, cache: GuestCache, single_disk_mode: bool = True) -> bool:
+    """Corrige /etc/fstab en place via augeas ; renvoie False si la lens fstab est indisponible"""
     try:
-        fstab_content = g.cat("/etc/fstab")
-        original_content = fstab_content
-
-        # Remplacer vda par sda si nécessaire
-        if "/dev/vda" in fstab_content:
-            fstab_content = fstab_content.replace("/dev/vda", "/dev/sda")
-            logger.info("Fixed /etc/fstab entries from vda to sda")
+        # Ne charger que /etc/fstab au lieu de toutes les lens sur tout /etc
+        g.aug_init("/", AUG_NO_LOAD | AUG_NO_MODL_AUTOLOAD)
+    except RuntimeError as e:
+        logger.warning(f"Augeas indisponible dans l'appliance : {e}")
+        return False
 
-        # En mode single disk, commenter les lignes pour les disques non disponibles
+    try:
+        try:
+            g.aug_set("/augeas/load/Fstab/lens", "Fstab.lns")
+            g.aug_set("/augeas/load/Fstab/incl", "/etc/fstab")
+            g.aug_load()
+            if not g.aug_match("/files/etc/fstab") or g.aug_match("/augeas/files/etc/fstab/error"):
+                return False
+        except RuntimeError as e:
+            logger.warning(f"Chargement de la lens Fstab impossible : {e}")
+            return False
+
+        changed = False
+        # Seules les entrées concernées sont lues, le filtrage est fait par augeas
+        for spec_node in g.aug_match(FSTAB_VDA_SPECS):
+            device = g.aug_get(spec_node).replace("/dev/vda", "/dev/sda")
+            g.aug_set(spec_node, device)
+            changed = True
+            logger.info(f"Fixed /etc/fstab entry {device} from vda to sda")
+
+        # En mode single disk, supprimer les entrées des disques non disponibles
         if single_disk_mode:
-            lines = fstab_content.split('\n')
-            new_lines = []
-            available_devices = set(g.list_devices())
-
-            for line in lines:
-                # Skip empty lines and comments
-                if not line.strip() or line.strip().startswith('#'):
-                    new_lines.append(line)
-                    continue
-
-                # Parse fstab line
-                parts = line.split()
-                if len(parts) >= 2:
-                    device = parts[0]
-                    mountpoint = parts[1]
-
-                    # Check if it's a device entry
-                    if device.startswith('/dev/'):
-                        # Extract base device
-                        device_base = device.rstrip('0123456789')
-
-                        # Check if device exists
-                        if device_base not in available_devices and any(skip_word in mountpoint.lower()
-                            for skip_word in ['backup', 'data', 'storage']):
-                            logger.info(f"Commenting out fstab entry for missing device: {device} -> {mountpoint}")
-                            new_lines.append(f"# {line} # Commented by migration - disk not available")
-                        else:
-                            new_lines.append(line)
-                    else:
-                        new_lines.append(line)
+            for entry in g.aug_match(FSTAB_SKIP_ENTRIES):
+                device = g.aug_get(f"{entry}/spec")
+                m = DEV_BASE_RE.match(device)
+                device_base = m.group(1) if m else device
+                if device_base not in cache.devices:
+                    mountpoint = g.aug_get(f"{entry}/file")
+                    logger.info(f"Removing fstab entry for missing device: {device} -> {mountpoint}")
+                    g.aug_rm(entry)
+                    changed = True
+
+        if changed:
+            # Backup du fstab original
+            g.cp("/etc/fstab", "/etc/fstab.bak.migration")
+            g.aug_save()
+            logger.info("Updated /etc/fstab")
+        return True
+    finally:
+        g.aug_close()
+
+
+def fix_fstab_as_text(g: guestfs.GuestFS, cache: GuestCache, single_disk_mode: bool = True) -> None:
+    """Corrige /etc/fstab par réécriture textuelle (repli sans augeas)"""
+    original_content = g.cat("/etc/fstab")
+    # Remplacer vda par sda : replace renvoie le même objet s'il n'y a aucune occurrence
+    fstab_content = original_content.replace("/dev/vda", "/dev/sda")
+    has_vda = fstab_content is not original_content
+    # Préfiltre : aucun parcours ligne à ligne si aucun mot-clé n'apparaît dans le fichier
+    needs_comment = single_disk_mode and SKIP_RE.search(original_content) is not None
+
+    # Rien à corriger : aucune écriture
+    if not needs_comment and not has_vda:
+        return
+
+    # Seule la substitution vda -> sda est nécessaire : sed dans l'appliance, sans parcours ligne à ligne
+    if not needs_comment:
+        g.sh("sed -i.bak.migration 's|/dev/vda|/dev/sda|g' /etc/fstab")
+        logger.info("Fixed /etc/fstab entries from vda to sda")
+        return
+
+    if has_vda:
+        logger.info("Fixed /etc/fstab entries from vda to sda")
+
+    # Mode single disk : commenter les lignes pour les disques non disponibles
+    lines = fstab_content.split('\n')
+    new_lines = []
+    available_devices = cache.devices
+
+    for line in lines:
+        # Skip empty lines and comments
+        if not line.strip() or line.strip().startswith('#'):
+            new_lines.append(line)
+            continue
+
+        # Parse fstab line
+        parts = line.split()
+        if len(parts) >= 2:
+            device = parts[0]
+            mountpoint = parts[1]
+
+            # Check if it's a device entry
+            if device.startswith('/dev/'):
+                # Extract base device
+                m = DEV_BASE_RE.match(device)
+                device_base = m.group(1) if m else device
+
+                # Check if device exists
+                if device_base not in available_devices and SKIP_RE.search(mountpoint):
+                    logger.info(f"Commenting out fstab entry for missing device: {device} -> {mountpoint}")
+                    new_lines.append(f"# {line} # Commented by migration - disk not available")
                 else:
                     new_lines.append(line)
+            else:
+                new_lines.append(line)
+        else:
+            new_lines.append(line)
 
-            fstab_content = '\n'.join(new_lines)
+    fstab_content = '\n'.join(new_lines)
 
-        # Write new fstab if changed
-        if fstab_content != original_content:
-            # Backup du fstab original
-            g.mv("/etc/fstab", "/etc/fstab.bak.migration")
+    # Write new fstab if changed
+    if fstab_content != original_content:
+        # Backup du fstab original
+        g.mv("/etc/fstab", "/etc/fstab.bak.migration")
 
-            # Écrire le nouveau fstab
-            g.write("/etc/fstab", fstab_content)
-            logger.info("Updated /etc/fstab")
+        # Écrire le nouveau fstab
+        g.write("/etc/fstab", fstab_content)
+        logger.info("Updated /etc/fstab")
+
+
+def fix_fstab_for_scaleway(g: guestfs.GuestFS, cache: GuestCache, single_disk_mode: bool = True) -> None:
+    """Corrige les entrées fstab pour Scaleway"""
+    try:
+        if not fix_fstab_with_augeas(g, cache, single_disk_mode):
+            logger.warning("Lens augeas fstab indisponible, réécriture textuelle de /etc/fstab")
+            fix_fstab_as_text(g, cache, single_disk_mode)
 
     except Exception as e:
         logger.error(f"Erreur lors de la correction du fstab : {e}")
 
 
-def fix_grub_for_scaleway(g: guestfs.GuestFS) -> None:
+def fix_grub_for_scaleway(g: guestfs.GuestFS, cache: GuestCache) -> None:
     """Corrige les entrées GRUB pour Scaleway (vda -> sda)"""
+    # Aucun fichier GRUB présent : pas d'appel à l'appliance
+    if not any(cache.exists[path] for path in GRUB_FILES):
+        return
+
     try:
-        # Corriger /etc/default/grub si nécessaire
-        if g.exists("/etc/default/grub"):
-            grub_content = g.cat("/etc/default/grub")
-            if "/dev/vda" in grub_content:
-                fixed_content = grub_content.replace("/dev/vda", "/dev/sda")
-                g.write("/etc/default/grub", fixed_content)
-                logger.info("Fixed /etc/default/grub entries from vda to sda")
-
-        # Corriger grub.cfg si accessible
-        grub_cfg_paths = ["/boot/grub2/grub.cfg", "/boot/grub/grub.cfg"]
-        for grub_cfg in grub_cfg_paths:
-            if g.exists(grub_cfg):
-                try:
-                    grub_cfg_content = g.cat(grub_cfg)
-                    if "/dev/vda" in grub_cfg_content:
-                        fixed_content = grub_cfg_content.replace("/dev/vda", "/dev/sda")
-                        g.write(grub_cfg, fixed_content)
-                        logger.info(f"Fixed {grub_cfg} entries from vda to sda")
-                except Exception as e:
-                    logger.warning(f"Could not fix {grub_cfg}: {e}")
+        for grub_file in g.sh(GRUB_FIX_SCRIPT).split():
+            logger.info(f"Fixed {grub_file} entries from vda to sda")
 
     except Exception as e:
         logger.error(f"Erreur lors de la correction de GRUB : {e}")
 
 
-def main(qcow_path: str, debug: bool = False) -> None:
+def new_handle(debug: bool = False, memsize: int = APPLIANCE_MEMSIZE, smp: int | None = None) -> guestfs.GuestFS:
+    """Crée un handle libguestfs configuré (non lancé)"""
     g = guestfs.GuestFS(python_return_dict=True)
-    g.backend = "direct"
+    # Backend direct par défaut, sauf choix explicite via LIBGUESTFS_BACKEND
+    if "LIBGUESTFS_BACKEND" not in os.environ:
+        g.set_backend("direct")
     g.set_trace(debug)
     g.set_verbose(debug)
+    # Pas de set_network() : aucune action n'utilise le réseau de l'appliance
+
+    # Dimensionnement de l'appliance
+    g.set_memsize(memsize)
+    g.set_smp(smp or min(APPLIANCE_MAX_SMP, os.cpu_count() or 1))
+    return g
 
+
+def add_image(g: guestfs.GuestFS, qcow_path: str, **opts) -> None:
+    """Ajoute l'image qcow2 à migrer au handle"""
     logger.info("Ajout du disque : %s", qcow_path)
-    g.add_drive_opts(qcow_path, format="qcow2", readonly=False)
-    g.set_network(True)
-    g.launch()
+    # cache=unsafe : les flush ne sont pas propagés à l'hôte, g.shutdown() est donc
+    # indispensable en cas de succès. Ce n'est pas un mécanisme de retour arrière :
+    # en cas d'échec l'image est partiellement modifiée et doit être refaite depuis la source
+    g.add_drive_opts(qcow_path, format="qcow2", readonly=False,
+                     cachemode="unsafe", discard="besteffort", **opts)
+
+
+def supports_hotplug(g: guestfs.GuestFS) -> bool:
+    """Indique si le backend permet d'échanger les disques à chaud (libvirt uniquement)"""
+    return g.get_backend().split(':', 1)[0] == "libvirt"
+
+
+def swap_image(g: guestfs.GuestFS, qcow_path: str) -> None:
+    """Remplace à chaud le disque de l'appliance lancée (hotplug)"""
+    g.umount_all()
+    g.sync()
+    g.drop_caches(3)
+    g.remove_drive(DRIVE_LABEL)
+    add_image(g, qcow_path, label=DRIVE_LABEL)
+
+
+def migrate_image(g: guestfs.GuestFS, skip_inspect: bool = False) -> None:
+    """Applique la migration Scaleway au disque attaché à l'appliance lancée"""
+    ensure_bases_tar()
+    cache = GuestCache(devices=frozenset(g.list_devices()))
+
+    # Invité CentOS connu : on peut se passer de l'inspection complète
+    mountpoints = probe_mountpoints(g) if skip_inspect else inspect_mountpoints(g)
 
     # Monter avec support single disk
-    mounted_points = guest_mount(g, single_disk_mode=True)
+    mounted_points = guest_mount(g, mountpoints, cache, single_disk_mode=True)
+    cache.probe(g, PROBE_PATHS)
 
     # Détecter le mode de boot
-    boot_mode = detect_boot_mode(g)
+    boot_mode = detect_boot_mode(cache)
 
     # Corriger fstab et grub AVANT les autres actions
-    fix_fstab_for_scaleway(g, single_disk_mode=True)
-    fix_grub_for_scaleway(g)
+    fix_fstab_for_scaleway(g, cache, single_disk_mode=True)
+    fix_grub_for_scaleway(g, cache)
+
+    # Les actions suivantes modifient le disque : le cache n'est plus valide
+    del cache
 
     # Préparer les actions selon le mode de boot
     actions = BASE_ACTIONS.copy()
 
-    # Ajouter umount /boot/efi seulement si UEFI et monté
-    if boot_mode == "uefi" and "/boot/efi" in mounted_points:
-        actions.append(["umount", "/boot/efi"])
+    # Démonter l'ESP après BASE_ACTIONS (grubby en a besoin) et avant le relabel SELinux
+    if boot_mode == "uefi" and EFI_MOUNTPOINT in mounted_points:
+        actions.append(["umount", EFI_MOUNTPOINT])
 
-    # Ajouter les actions SELinux
-    actions.extend([
-        ["selinux_relabel", "/etc/selinux/targeted/contexts/files/file_contexts", "/boot"],
-        ["selinux_relabel", "/etc/selinux/targeted/contexts/files/file_contexts", "/"],
-    ])
+    # Ajouter les actions SELinux : / couvre /boot sauf s'il s'agit d'un système de fichiers séparé,
+    # auquel cas / passe en premier pour que le relabel de /boot profite du cache
+    actions.append(["selinux_relabel", SELINUX_FILE_CONTEXTS, "/"])
+    if "/boot" in mounted_points:
+        actions.append(["selinux_relabel", SELINUX_FILE_CONTEXTS, "/boot"])
 
-    # Exécuter les actions
+    # Valider les actions et lier les méthodes du handle une seule fois
+    bound = []
     for action in actions:
         mname, *args = action
         if not isinstance(mname, str):
             raise TypeError(f"Entrée mal formée dans ACTIONS : {action!r}")
+        bound.append((mname, getattr(g, mname), args))
 
+    # Exécuter les actions
+    for mname, fn, args in bound:
         try:
-            ret = getattr(g, mname)(*args)
+            ret = fn(*args)
             if isinstance(ret, int) and ret != 0:
                 raise RuntimeError(f"{mname} a renvoyé le code d'erreur {ret}")
         except Exception as e:
@@ -235,12 +490,109 @@ def main(qcow_path: str, debug: bool = False) -> None:
             if mname not in ["umount", "selinux_relabel"]:
                 raise
 
+
+def migrate_one(qcow_path: str, debug: bool = False, memsize: int = APPLIANCE_MEMSIZE,
+                smp: int | None = None, skip_inspect: bool = False) -> None:
+    """Migre une image avec une appliance dédiée"""
+    g = new_handle(debug, memsize=memsize, smp=smp)
+    try:
+        add_image(g, qcow_path)
+        g.launch()
+        migrate_image(g, skip_inspect)
+    except Exception:
+        # Échec : image partiellement modifiée, à refaire depuis la source
+        g.close()
+        raise
+
+    # Fermer proprement
+    g.shutdown()
+    g.close()
+
+
+def migrate_many(qcow_paths: list[str], workers: int | None = None, debug: bool = False,
+                 skip_inspect: bool = False) -> None:
+    """Migre plusieurs images en parallèle, une appliance réduite par processus"""
+    os.environ.setdefault("LIBGUESTFS_CACHEDIR", WORKER_CACHEDIR)
+    workers = workers or max(1, (os.cpu_count() or 1) // 4)
+    logger.info(f"Migration de {len(qcow_paths)} images avec {workers} workers")
+
+    worker = partial(migrate_one, debug=debug, memsize=WORKER_MEMSIZE, smp=WORKER_SMP,
+                     skip_inspect=skip_inspect)
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(worker, qcow_path): qcow_path for qcow_path in qcow_paths}
+        # Chaque échec est rapporté avec son image, sans interrompre les autres migrations
+        for future in as_completed(futures):
+            qcow_path = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Échec de la migration de {qcow_path} : {e}")
+                failed.append(qcow_path)
+
+    if failed:
+        raise RuntimeError(f"{len(failed)}/{len(qcow_paths)} migrations en échec : {', '.join(failed)}")
+
+
+def main(qcow_paths: list[str], debug: bool = False, skip_inspect: bool = False) -> None:
+    # Une seule image : chemin classique, une appliance dédiée
+    if len(qcow_paths) == 1:
+        migrate_one(qcow_paths[0], debug, skip_inspect=skip_inspect)
+        return
+
+    # Plusieurs images : une seule appliance si le backend permet le hotplug (libvirt),
+    # sinon (backend direct) une appliance par image
+    g = None
+    hotplug = None
+    try:
+        for qcow_path in qcow_paths:
+            if g is not None and hotplug:
+                try:
+                    swap_image(g, qcow_path)
+                except RuntimeError as e:
+                    logger.warning(f"Échec du hotplug, relance de l'appliance par image : {e}")
+                    hotplug = False
+
+            if g is not None and not hotplug:
+                g.shutdown()
+                g.close()
+                g = None
+
+            if g is None:
+                g = new_handle(debug)
+                if hotplug is None:
+                    hotplug = supports_hotplug(g)
+                    if not hotplug:
+                        logger.info(f"Backend {g.get_backend()} sans hotplug : une appliance par image")
+                add_image(g, qcow_path, label=DRIVE_LABEL)
+                g.launch()
+
+            migrate_image(g, skip_inspect)
+    except Exception:
+        # Échec : image en cours partiellement modifiée, à refaire depuis la source
+        if g is not None:
+            g.close()
+        raise
+
     # Fermer proprement
     g.shutdown()
     g.close()
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        sys.exit(f"Usage : {sys.argv[0]} <image.qcow2>")
-    main(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Prépare des images CentOS pour Scaleway")
+    parser.add_argument("images", nargs="+", metavar="image.qcow2")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="nombre de migrations en parallèle (0 = automatique, défaut : 1)")
+    parser.add_argument("--skip-inspect", action="store_true",
+                        help="court-circuite l'inspection libguestfs (invité CentOS connu)")
+    parser.add_argument("--debug", action="store_true", help="active la trace libguestfs")
+    args = parser.parse_args()
+    if args.workers < 0:
+        parser.error("--workers doit être positif ou nul")
+
+    if args.workers != 1 and len(args.images) > 1:
+        migrate_many(args.images, workers=args.workers or None, debug=args.debug,
+                     skip_inspect=args.skip_inspect)
+    else:
+        main(args.images, debug=args.debug, skip_inspect=args.skip_inspect)
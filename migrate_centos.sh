@@ -2,6 +2,8 @@
 set -euo pipefail
 
 export LIBGUESTFS_BACKEND=direct
+# Réutiliser l'appliance en cache (/var/tmp/.guestfs-*) d'une migration à l'autre
+export LIBGUESTFS_CACHEDIR="${LIBGUESTFS_CACHEDIR:-/var/tmp}"
 
 # Vérifier les paramètres
 if [ $# -lt 2 ]; then
@@ -0,0 +1,85 @@
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+# python3-libguestfs n'est pas requis pour ces tests : le handle est simulé
+sys.modules.setdefault("guestfs", types.SimpleNamespace(GuestFS=object))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import migrate_centos  # noqa: E402
+
+FSTAB = (
+    "/dev/vda1 / xfs defaults 0 0\n"
+    "/dev/vdb1 /data ext4 defaults 0 0\n"
+)
+
+
+class FakeGuestFS:
+    """Handle simulé : augeas échoue sur l'appel indiqué, le reste opère sur un fstab en mémoire"""
+
+    def __init__(self, failing_call):
+        self.failing_call = failing_call
+        self.files = {"/etc/fstab": FSTAB}
+        self.calls = []
+
+    def _record(self, name, *args):
+        self.calls.append((name, args))
+        if name == self.failing_call:
+            raise RuntimeError(f"{name} failed")
+
+    def aug_init(self, root, flags):
+        self._record("aug_init", root, flags)
+
+    def aug_set(self, path, value):
+        self._record("aug_set", path, value)
+
+    def aug_load(self):
+        self._record("aug_load")
+
+    def aug_match(self, path):
+        self._record("aug_match", path)
+        return []
+
+    def aug_close(self):
+        self._record("aug_close")
+
+    def cat(self, path):
+        return self.files[path]
+
+    def mv(self, src, dest):
+        self.files[dest] = self.files.pop(src)
+
+    def write(self, path, content):
+        self.files[path] = content
+
+    def sh(self, command):
+        raise AssertionError(f"sh inattendu : {command}")
+
+
+@pytest.mark.parametrize("failing_call", ["aug_init", "aug_set", "aug_load"])
+def test_fix_fstab_falls_back_to_text_when_augeas_setup_fails(failing_call):
+    g = FakeGuestFS(failing_call)
+    cache = migrate_centos.GuestCache(devices=frozenset({"/dev/sda"}))
+
+    migrate_centos.fix_fstab_for_scaleway(g, cache, single_disk_mode=True)
+
+    assert g.files["/etc/fstab.bak.migration"] == FSTAB
+    assert g.files["/etc/fstab"] == (
+        "/dev/sda1 / xfs defaults 0 0\n"
+        "# /dev/vdb1 /data ext4 defaults 0 0 # Commented by migration - disk not available\n"
+    )
+
+
+def test_fix_fstab_with_augeas_disables_module_autoload():
+    g = FakeGuestFS(failing_call=None)
+    cache = migrate_centos.GuestCache(devices=frozenset({"/dev/sda"}))
+
+    # Aucun nœud /files/etc/fstab : la lens est considérée indisponible
+    assert migrate_centos.fix_fstab_with_augeas(g, cache) is False
+
+    flags = g.calls[0][1][1]
+    assert flags & migrate_centos.AUG_NO_LOAD
+    assert flags & migrate_centos.AUG_NO_MODL_AUTOLOAD
+    assert ("aug_close", ()) in g.calls